@@ -11,7 +11,8 @@ SITE_PACKAGES=$(pipenv --venv)/lib/python3.7/site-packages
 echo "Library Location: $SITE_PACKAGES"
 cd ${SITE_PACKAGES}
 7z a -tzip -mx=9 ${DIR}/package.zip * -x!boto3 -x!boto3* -x!botocore -x!botocore*
-7z a -tzip -mx=9 ${DIR}/package.zip boto3_type_annotations*
 cd ${DIR}
+echo "Generate _config.py from config.ini"
+python3 build_config.py config.ini _config.py || exit 1
 7z d package.zip pip pip* setuptools setuptools* wheel wheel* pkg_resources pkg_resources* easy_install easy_install* -r
-7z a package.zip router.py config.ini
+7z a package.zip router.py _config.py
@@ -0,0 +1,19 @@
+import sys
+from configparser import ConfigParser
+from pprint import pformat
+
+
+def build_config(source: str = 'config.ini', target: str = '_config.py'):
+    config = ConfigParser(interpolation=None)
+    if not config.read(source):
+        raise FileNotFoundError(source)
+    recipients = {k: [r.strip() for r in v.split(',')] for k, v in config.items("Recipients")}
+    templates = dict(config.items("Templates"))
+    with open(target, 'w') as f:
+        f.write(f"# Generated from {source} by build_config.py, do not edit.\n")
+        f.write(f"RECIPIENTS = {pformat(recipients)}\n")
+        f.write(f"TEMPLATES = {pformat(templates)}\n")
+
+
+if __name__ == '__main__':
+    build_config(*sys.argv[1:])
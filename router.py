@@ -1,19 +1,52 @@
-import datetime
 import json
 import logging
 import os
-from configparser import ConfigParser
-from typing import Dict, List
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Dict, List
 from urllib.parse import quote
 
 import boto3
-from aws_xray_sdk.core import patch, xray_recorder
-from boto3_type_annotations.lambda_ import Client
+import orjson
+from botocore.config import Config
 from botocore.exceptions import ClientError
 
-patch(['boto3'])
+from _config import RECIPIENTS, TEMPLATES
+
+if TYPE_CHECKING:
+    from boto3_type_annotations.lambda_ import Client
+
+
+class NullRecorder:
+    def capture(self, name=None):
+        return lambda func: func
+
+    def begin_subsegment(self, name):
+        pass
+
+    def end_subsegment(self):
+        pass
+
+    def put_annotation(self, key, value):
+        pass
+
+
+XRAY_ENABLED = os.getenv('ENABLE_XRAY', '1') == '1'
+if XRAY_ENABLED:
+    from aws_xray_sdk.core import patch, xray_recorder
+
+    patch(['boto3'])
+else:
+    xray_recorder = NullRecorder()
 
 LAMBDA_NAME = os.getenv('NOTIFY_LAMBDA_NAME')
+MAX_WORKERS = 10
+BATCH_RECIPIENTS = os.getenv('BATCH_RECIPIENTS') == '1'
+RECIPIENT_BATCH_SIZE = 10
+MAX_LOGGED_PAYLOAD = 512
+LAMBDA_CLIENT: 'Client' = boto3.client('lambda', 'eu-west-1', config=Config(
+    max_pool_connections=MAX_WORKERS,
+    retries={'max_attempts': 2}
+))
 
 COLOURS = {
     'INSUFFICIENT_DATA': 'fce94f',
@@ -21,121 +54,162 @@ COLOURS = {
     'OK': 'acda00'
 }
 
+TEAMS_TEMPLATE = (
+    '{{"message_type": "teams", "body": {{'
+    '"@type": "MessageCard", '
+    '"@context": "https://schema.org/extensions", '
+    '"summary": {summary}, '
+    '"title": "AWS Cloudwatch Alarm", '
+    '"themeColor": "{theme_colour}", '
+    '"sections": [{{'
+    '"title": {section_title}, '
+    '"text": {text}, '
+    '"facts": ['
+    '{{"name": "Time", "value": {time}}}, '
+    '{{"name": "Old State", "value": {old_state}}}, '
+    '{{"name": "New State", "value": {new_state}}}, '
+    '{{"name": "Reason", "value": {reason}}}'
+    ']'
+    '}}], '
+    '"potentialAction": [{{'
+    '"@type": "OpenUri", '
+    '"name": "Link to Alarm", '
+    '"targets": [{{'
+    '"os": "default", '
+    '"uri": "https://console.aws.amazon.com/cloudwatch/home?region={region}'
+    '#alarm:alarmFilter=ANY;name={quoted_alarm_name}"'
+    '}}]'
+    '}}]'
+    '}}}}'
+)
+
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
-config = ConfigParser()
-config.read('config.ini')
+ETL_TEMPLATE_ID = TEMPLATES['etlalarm']
 
 
 @xray_recorder.capture('Invoke DevOps Notify')
-def send_payload(payload: Dict):
+def send_payload(payload: bytes):
     try:
-        lamb: Client = boto3.client('lambda', 'eu-west-1')
-        resp: Dict = lamb.invoke(FunctionName=LAMBDA_NAME, Payload=json.dumps(payload), InvocationType='Event')
+        resp: Dict = LAMBDA_CLIENT.invoke(FunctionName=LAMBDA_NAME, Payload=payload, InvocationType='Event')
         code = resp.get('StatusCode')
         if code != 202:
-            logger.info(f"FunctionError: {code}")
-            raise RuntimeError(f'{LAMBDA_NAME} failed to notify with {payload}')
+            logger.info("FunctionError: %s", code)
+            raise RuntimeError(f'{LAMBDA_NAME} failed to notify with {payload[:MAX_LOGGED_PAYLOAD]!r}')
     except ClientError:
         logger.exception("Error when invoking DevOps notify.")
         raise
 
 
+def send_payloads(payloads: List[bytes]):
+    if XRAY_ENABLED or len(payloads) < 2:
+        for payload in payloads:
+            send_payload(payload)
+        return
+    with ThreadPoolExecutor(max_workers=min(MAX_WORKERS, len(payloads))) as executor:
+        list(executor.map(send_payload, payloads))
+
+
 @xray_recorder.capture('Get Recipients')
 def get_recipients(alarm_name) -> List[str]:
     xray_recorder.put_annotation('Alarm Name', alarm_name)
-    return [r.strip() for r in config.get(section="Recipients", option=alarm_name).split(',')]
+    return RECIPIENTS[alarm_name.lower()]
 
 
-def handler(event, context):
-    logger.info(f"Event: {str(event)}")
-    records = event['Records']
-    for record in records:
-        message = json.loads(record['Sns']['Message'])
-        logger.info(f"Message: {str(message)}")
-        timestamp = datetime.datetime.fromisoformat(record['Sns']['Timestamp'].replace("Z", "+00:00"))
-        region = record['EventSubscriptionArn'].split(":")[3]
-        alarm_name = message['AlarmName']
-        old_state = message['OldStateValue']
-        new_state = message['NewStateValue']
-        reason = message['NewStateReason']
-        trigger = message['Trigger']
-        if trigger['Namespace'] == 'ETL':
-            xray_recorder.begin_subsegment('ETL Route')
-            template_id = config.get(section="Templates", option="ETLAlarm")
-            for recipient in get_recipients(alarm_name):
-                payload = {
+def build_teams_payload(alarm_name, quoted_alarm_name, statistic, metric_name, operator, threshold, eval_periods,
+                        period, timestamp, old_state, new_state, theme_colour, reason, region) -> bytes:
+    return TEAMS_TEMPLATE.format(
+        summary=json.dumps(f"AWS Cloudwatch Alarm: {alarm_name} has transitioned"),
+        theme_colour=theme_colour,
+        section_title=json.dumps(f"{alarm_name} has transitioned"),
+        text=json.dumps(f"{statistic} {metric_name} {operator} {threshold} for {eval_periods}"
+                        f" periods(s) of {period} seconds."),
+        time=json.dumps(timestamp),
+        old_state=json.dumps(old_state),
+        new_state=json.dumps(new_state),
+        reason=json.dumps(reason),
+        region=region,
+        quoted_alarm_name=quoted_alarm_name
+    ).encode()
+
+
+def process_record(record: Dict):
+    sns = record['Sns']
+    message = orjson.loads(sns['Message'])
+    logger.debug("Message: %s", message)
+    timestamp = sns['Timestamp'].replace("Z", "+00:00")
+    region = record['EventSubscriptionArn'].split(":", 4)[3]
+    alarm_name = message['AlarmName']
+    quoted_alarm_name = quote(alarm_name)
+    old_state = message['OldStateValue']
+    new_state = message['NewStateValue']
+    if new_state not in COLOURS:
+        logger.warning("Alarm: %s, Unknown State: %s", alarm_name, new_state)
+        return
+    logger.info("Alarm: %s, New State: %s", alarm_name, new_state)
+    theme_colour = COLOURS[new_state]
+    reason = message['NewStateReason']
+    trigger = message['Trigger']
+    namespace = trigger['Namespace']
+    statistic = trigger['Statistic']
+    metric_name = trigger['MetricName']
+    operator = trigger['ComparisonOperator']
+    threshold = trigger['Threshold']
+    eval_periods = trigger['EvaluationPeriods']
+    period = trigger['Period']
+    if namespace == 'ETL':
+        xray_recorder.begin_subsegment('ETL Route')
+        recipients = get_recipients(alarm_name)
+        template_vars = {
+            "alarm_name": alarm_name,
+            "statistic": statistic,
+            "metric_name": metric_name,
+            "operator": operator,
+            "threshold": threshold,
+            "eval_periods": eval_periods,
+            "period": period,
+            "time": timestamp,
+            "old_state": old_state,
+            "new_state": new_state,
+            "reason": reason,
+            "region": region,
+            "quoted_alarm_name": quoted_alarm_name
+        }
+        if BATCH_RECIPIENTS:
+            payloads = [
+                {
                     "message_type": "email",
-                    "to": recipient,
-                    "template_id": template_id,
-                    "template_vars": {
-                        "alarm_name": alarm_name,
-                        "statistic": trigger['Statistic'],
-                        "metric_name": trigger['MetricName'],
-                        "operator": trigger['ComparisonOperator'],
-                        "threshold": trigger['Threshold'],
-                        "eval_periods": trigger['EvaluationPeriods'],
-                        "period": trigger['Period'],
-                        "time": timestamp.isoformat(),
-                        "old_state": old_state,
-                        "new_state": new_state,
-                        "reason": reason,
-                        "region": region,
-                        "quoted_alarm_name": quote(alarm_name)
-                    }
+                    "recipients": recipients[i:i + RECIPIENT_BATCH_SIZE],
+                    "template_id": ETL_TEMPLATE_ID,
+                    "template_vars": template_vars
                 }
-                send_payload(payload)
-            xray_recorder.end_subsegment()
+                for i in range(0, len(recipients), RECIPIENT_BATCH_SIZE)
+            ]
         else:
-            xray_recorder.begin_subsegment('DevOps Route')
-            payload = {
-                "message_type": "teams",
-                "body": {
-                    "@type": "MessageCard",
-                    "@context": "https://schema.org/extensions",
-                    "summary": f"AWS Cloudwatch Alarm: {alarm_name} has transitioned",
-                    "title": "AWS Cloudwatch Alarm",
-                    "themeColor": COLOURS[new_state],
-                    "sections": [
-                        {
-                            "title": f"{alarm_name} has transitioned",
-                            "text": f"{trigger['Statistic']} {trigger['MetricName']} {trigger['ComparisonOperator']}"
-                            f" {trigger['Threshold']} for {trigger['EvaluationPeriods']}"
-                            f" periods(s) of {trigger['Period']} seconds.",
-                            "facts": [
-                                {
-                                    "name": "Time",
-                                    "value": timestamp.isoformat()
-                                },
-                                {
-                                    "name": "Old State",
-                                    "value": old_state
-                                },
-                                {
-                                    "name": "New State",
-                                    "value": new_state
-                                },
-                                {
-                                    "name": "Reason",
-                                    "value": reason
-                                }
-                            ],
-                        }
-                    ],
-                    "potentialAction": [
-                        {
-                            "@type": "OpenUri",
-                            "name": "Link to Alarm",
-                            "targets": [
-                                {
-                                    "os": "default",
-                                    "uri": f"https://console.aws.amazon.com/cloudwatch/home?region={region}"
-                                    f"#alarm:alarmFilter=ANY;name={quote(alarm_name)}"
-                                }
-                            ]
-                        }
-                    ]
+            payloads = [
+                {
+                    "message_type": "email",
+                    "to": recipient,
+                    "template_id": ETL_TEMPLATE_ID,
+                    "template_vars": template_vars
                 }
-            }
-            send_payload(payload)
-            xray_recorder.end_subsegment()
+                for recipient in recipients
+            ]
+        send_payloads([orjson.dumps(payload) for payload in payloads])
+        xray_recorder.end_subsegment()
+    else:
+        xray_recorder.begin_subsegment('DevOps Route')
+        payload = build_teams_payload(alarm_name=alarm_name, quoted_alarm_name=quoted_alarm_name,
+                                      statistic=statistic, metric_name=metric_name, operator=operator,
+                                      threshold=threshold, eval_periods=eval_periods, period=period,
+                                      timestamp=timestamp, old_state=old_state, new_state=new_state,
+                                      theme_colour=theme_colour, reason=reason, region=region)
+        send_payload(payload)
+        xray_recorder.end_subsegment()
+
+
+def handler(event, context):
+    logger.debug("Event: %s", event)
+    records = event['Records']
+    for record in records:
+        process_record(record)